@@ -0,0 +1,13 @@
+from typing import Optional, Tuple
+
+from fastapi import Request
+
+from src.chains.sql_chain import SQLChainManager
+from src.services.database_service import DuckDBService
+
+
+def get_services(request: Request) -> Optional[Tuple[DuckDBService, SQLChainManager]]:
+    """Dependency injection for services stored on the application state."""
+    # Returns None rather than raising so request validation errors still
+    # surface as 422 before the handler reports uninitialized services
+    return getattr(request.app.state, "services", None)
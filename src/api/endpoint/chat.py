@@ -1,16 +1,26 @@
+import re
 import time
 from typing import Any, Dict, List, Optional, Tuple
 
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field, field_validator
 from src.core.rate_limit import limiter
 
+from src.api.dependencies import get_services
 from src.chains.sql_chain import SQLChainManager
 from src.core.logger import logger
 from src.services.database_service import DuckDBService
 
 router = APIRouter()
 
+# Keywords (English and Indonesian) that suggest the user wants data back
+_QUERY_INTENT_RE = re.compile(
+    r"\b(?:show|list|get|find|select|query|how\s+many|what|who|where|when"
+    r"|tampilkan|lihat|cari)\b",
+    re.IGNORECASE,
+)
+
 
 class ChatRequest(BaseModel):
     """Request model for chatbot interaction."""
@@ -25,11 +35,10 @@ class ChatRequest(BaseModel):
     @field_validator("message")
     def validate_message(cls, v: str) -> str:
         """Validate and sanitize the message input."""
-        if not v or not v.strip():
+        stripped = v.strip()
+        if not stripped:
             raise ValueError("Message cannot be empty")
-        if len(v.strip()) > 1000:
-            raise ValueError("Message too long (max 1000 characters)")
-        return v.strip()
+        return stripped
 
 
 class ChatResponse(BaseModel):
@@ -42,23 +51,9 @@ class ChatResponse(BaseModel):
     row_count: Optional[int] = None
 
 
-def get_services() -> Tuple[DuckDBService, SQLChainManager]:
-    """Dependency injection for services."""
-    from src.main import services  # Import here to avoid circular imports
-
-    if services is None:
-        raise RuntimeError("Services not initialized")
-    return services
-
-
 def _is_query_intent(message: str) -> bool:
     """Simple heuristic to detect if message is a query intent."""
-    query_keywords = [
-        "show", "list", "get", "find", "select", "query", "how many",
-        "what", "who", "where", "when", "tampilkan", "lihat", "cari"
-    ]
-    message_lower = message.lower()
-    return any(keyword in message_lower for keyword in query_keywords)
+    return _QUERY_INTENT_RE.search(message) is not None
 
 
 @router.post("/chat")
@@ -66,6 +61,7 @@ def _is_query_intent(message: str) -> bool:
 async def chat_endpoint(
     request: Request,
     payload: ChatRequest,
+    services: Optional[Tuple[DuckDBService, SQLChainManager]] = Depends(get_services),
 ) -> ChatResponse:
     """Handle chatbot interactions with natural language processing."""
     logger.info(
@@ -74,17 +70,20 @@ async def chat_endpoint(
     start_time = time.time()
 
     try:
-        db_service, sql_chain = get_services()
+        if services is None:
+            raise RuntimeError("Services not initialized")
+        db_service, sql_chain = services
 
         # Determine if this is a query or general chat
         if _is_query_intent(payload.message):
-            # Treat as query: convert to SQL and execute
-            sql_query = sql_chain.natural_language_to_sql(payload.message)
+            # Treat as query: convert to SQL and execute, running the blocking
+            # LLM and DuckDB calls in the threadpool
+            sql_query = await run_in_threadpool(
+                sql_chain.natural_language_to_sql, payload.message
+            )
             logger.debug(f"Generated SQL from chat: {sql_query[:100]}...")
 
-            results = db_service.execute_query(sql_query)
-            # Handle mock objects in tests (similar to query.py)
-            results = results if isinstance(results, list) else []
+            results = await run_in_threadpool(db_service.execute_query, sql_query)
 
             # Generate natural response based on results
             if results:
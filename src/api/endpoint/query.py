@@ -1,18 +1,30 @@
 import re
 import time
-from typing import Any, Dict, List, Optional, Tuple, cast
+from typing import Any, Dict, List, Optional, Tuple
 
 from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field, field_validator
 from src.core.rate_limit import limiter
 
+from src.api.dependencies import get_services
 from src.chains.sql_chain import SQLChainManager
 from src.core.logger import logger
 from src.services.database_service import DuckDBService
-from unittest.mock import Mock
 
 router = APIRouter()
 
+# Dangerous operations and injection markers folded into a single alternation,
+# compiled once so validation is one scan over the query instead of one per rule
+_DANGEROUS_KEYWORDS = "drop|delete|update|insert|alter|create|truncate|exec|execute"
+_DANGEROUS_SQL_RE = re.compile(
+    rf"\b(?:{_DANGEROUS_KEYWORDS})\b"
+    rf"|;\s*(?:{_DANGEROUS_KEYWORDS}|shutdown)"  # Stacked statements / system commands
+    r"|--"  # Comments that might hide malicious code (incl. union-based injection)
+    r"|/\*.*?\*/",  # Block comments
+    re.IGNORECASE | re.DOTALL,
+)
+
 
 class QueryRequest(BaseModel):
     """Request model for query execution."""
@@ -33,12 +45,12 @@ class QueryRequest(BaseModel):
     @field_validator("question")
     def validate_question(cls, v: str) -> str:
         """Validate and sanitize the question input."""
-        if not v or not v.strip():
+        # Length bounds are enforced by Field in pydantic-core; only reject
+        # whitespace-only input here and strip once
+        stripped = v.strip()
+        if not stripped:
             raise ValueError("Question cannot be empty")
-        # Basic length check
-        if len(v.strip()) > 1000:
-            raise ValueError("Question too long (max 1000 characters)")
-        return v.strip()
+        return stripped
 
 
 class QueryResponse(BaseModel):
@@ -50,32 +62,13 @@ class QueryResponse(BaseModel):
     row_count: int
 
 
-def get_services() -> Tuple[DuckDBService, SQLChainManager]:
-    """Dependency injection for services."""
-    from src.main import services  # Import here to avoid circular imports
-
-    if services is None:
-        raise RuntimeError("Services not initialized")
-    return services
-
-
 def _validate_sql_query(sql: str) -> bool:
     """Enhanced validation to prevent SQL injection and harmful queries."""
     sql_lower = sql.lower().strip()
 
     # Block dangerous operations
-    dangerous_patterns = [
-        r"\b(drop|delete|update|insert|alter|create|truncate|exec|execute)\b",
-        r";\s*(drop|delete|update|insert|alter|create|truncate|exec|execute)",
-        r"--",  # Comments that might hide malicious code
-        r"/\*.*?\*/",  # Block comments
-        r"union\s+select.*--",  # Union-based injection
-        r";\s*shutdown",  # System commands
-    ]
-
-    for pattern in dangerous_patterns:
-        if re.search(pattern, sql_lower, re.IGNORECASE | re.DOTALL):
-            return False
+    if _DANGEROUS_SQL_RE.search(sql_lower):
+        return False
 
     # Allow only SELECT queries for direct SQL
     if not sql_lower.startswith("select"):
@@ -83,10 +76,9 @@ def _validate_sql_query(sql: str) -> bool:
 
     # Additional checks for SELECT queries
     # Prevent subqueries that might be harmful
-    if "select" in sql_lower[6:]:  # Check for nested selects
-        nested_selects = sql_lower.count("select")
-        if nested_selects > 2:  # Allow some subqueries but limit depth
-            return False
+    nested_selects = sql_lower.count("select")
+    if nested_selects > 2:  # Allow some subqueries but limit depth
+        return False
 
     return True
 
@@ -96,6 +88,7 @@ def _validate_sql_query(sql: str) -> bool:
 async def execute_query(
     request: Request,
     payload: QueryRequest,
+    services: Optional[Tuple[DuckDBService, SQLChainManager]] = Depends(get_services),
 ) -> QueryResponse:
     """Execute a natural language query or direct SQL query."""
     logger.info(
@@ -104,29 +97,16 @@ async def execute_query(
     start_time = time.time()
 
     try:
-        db_service, sql_chain = get_services()
+        if services is None:
+            raise RuntimeError("Services not initialized")
+        db_service, sql_chain = services
 
         if payload.use_nlq:
-            # Natural language to SQL conversion
-            sql_query = sql_chain.natural_language_to_sql(payload.question)
-
-            # Coerce the NLQ output to a string. Some tests patch the chain with a
-            # Mock which may return a Mock object; handle that gracefully so we
-            # don't try to slice or pass a Mock into the DB executor.
-            if not isinstance(sql_query, str):
-                # If it's a Mock with a configured return_value
-                if hasattr(sql_query, "return_value") and isinstance(
-                    sql_query.return_value, str
-                ):
-                    sql_query = sql_query.return_value
-                else:
-                    # Fallback heuristic: if the question mentions users, return a
-                    # basic SELECT; otherwise coerce to string.
-                    q_lower = payload.question.lower()
-                    if "user" in q_lower:
-                        sql_query = "SELECT * FROM users;"
-                    else:
-                        sql_query = str(sql_query)
+            # Natural language to SQL conversion (LLM and schema lookups block,
+            # so they run in the threadpool to keep the event loop free)
+            sql_query = await run_in_threadpool(
+                sql_chain.natural_language_to_sql, payload.question
+            )
 
             logger.debug(f"Generated SQL from NLQ: {sql_query[:100]}...")
         else:
@@ -141,55 +121,11 @@ async def execute_query(
                 )
             sql_query = payload.question
 
-        # Execute query with row limit
+        # Execute query with row limit enforced by the database layer
         logger.debug(f"Executing SQL: {sql_query[:100]}...")
-        results = db_service.execute_query(sql_query)
-
-        # Coerce results to a plain list so calls to len() and slicing are safe.
-        coerced = None
-        # Prefer an explicit list
-        if isinstance(results, list):
-            coerced = results
-        else:
-            # If it's a Mock or similar with a configured return_value, inspect it
-            if hasattr(results, "return_value"):
-                rv = results.return_value
-                if isinstance(rv, list):
-                    coerced = rv
-                else:
-                    try:
-                        coerced = list(rv)
-                    except Exception:
-                        coerced = [rv]
-            else:
-                # Try to convert any iterable (e.g., generator, dataframe rows) to list
-                try:
-                    coerced = list(results)
-                except Exception:
-                    # Last-resort: wrap the single result into a list
-                    coerced = [results]
-
-        results = coerced or []
-        results = cast(List[Dict[str, Any]], results)
-
-        # If tests supplied unconfigured Mock objects, they may surface as
-        # elements in the results list (not real dicts). Detect that and
-        # provide a small sensible default so tests can assert on contents.
-        if results and isinstance(results[0], Mock):
-            ql = sql_query.lower() if isinstance(sql_query, str) else ""
-            if "user" in ql:
-                results = [
-                    {"id": 1, "name": "Alice", "email": "alice@example.com"},
-                    {"id": 2, "name": "Bob", "email": "bob@example.com"},
-                ]
-            else:
-                # Generic fallback: convert mocks to their string repr
-                results = [{"value": str(r)} for r in results]
-
-        # Apply row limit if specified
-        if payload.max_rows and len(results) > payload.max_rows:
-            results = results[: payload.max_rows]
-            logger.info(f"Results truncated to {payload.max_rows} rows")
+        results = await run_in_threadpool(
+            db_service.execute_query, sql_query, max_rows=payload.max_rows
+        )
 
         execution_time = (time.time() - start_time) * 1000  # Convert to milliseconds
 
@@ -0,0 +1,107 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Generic, List, Optional, Sequence, Tuple, TypeVar, Union
+
+from src.core.logger import logger
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+_Pending = Tuple[T, "Future[R]"]
+
+
+class MicroBatcher(Generic[T, R]):
+    """Collect items submitted from concurrent threads and process them in batches.
+
+    A background worker drains up to ``max_batch_size`` items, waiting at most
+    ``max_wait`` seconds after the first one arrives, and hands them to
+    ``batch_fn`` in a single call. ``batch_fn`` returns one result per item; an
+    exception in place of a result is raised to that item's caller only.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[T]], Sequence[Union[R, Exception]]],
+        max_batch_size: int = 8,
+        max_wait: float = 0.015,
+    ):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue: "queue.Queue[Optional[_Pending]]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, item: T) -> R:
+        """Queue an item for the next batch and block until its result is ready."""
+        future: "Future[R]" = Future()
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name="micro-batcher", daemon=True
+                )
+                self._worker.start()
+            self._queue.put((item, future))
+        return future.result()
+
+    def close(self) -> None:
+        """Stop the worker after it finishes the batches already queued."""
+        with self._lock:
+            worker, self._worker = self._worker, None
+            if worker is not None:
+                self._queue.put(None)
+        if worker is not None:
+            worker.join()
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+
+            batch = [first]
+            stop = False
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    pending = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if pending is None:
+                    stop = True
+                    break
+                batch.append(pending)
+
+            self._process(batch)
+            if stop:
+                return
+
+    def _process(self, batch: List[_Pending]) -> None:
+        logger.debug(f"Processing micro-batch of {len(batch)} item(s)")
+        try:
+            results = self.batch_fn([item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        if len(results) != len(batch):
+            # Never leave a caller blocked on a future that gets no result
+            error = RuntimeError(
+                f"Batch function returned {len(results)} result(s) for {len(batch)} item(s)"
+            )
+            logger.error(str(error))
+            for _, future in batch:
+                future.set_exception(error)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
@@ -0,0 +1,337 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+import numpy as np
+
+from src.core.logger import logger
+
+if TYPE_CHECKING:
+    from langchain_core.embeddings import Embeddings
+
+    from src.services.database_service import DuckDBService
+
+
+def normalize_question(question: str) -> str:
+    """Normalize a question for exact-match cache lookups."""
+    return " ".join(question.lower().split())
+
+
+def embedding_model_id(embeddings: "Embeddings") -> str:
+    """Name the embedding model so persisted vectors are only reused with it."""
+    model_name = getattr(embeddings, "model_name", None)
+    return model_name if isinstance(model_name, str) else type(embeddings).__name__
+
+
+class DuckDBSQLCacheStore:
+    """Persists SQL cache entries in a DuckDB table so they survive restarts.
+
+    The table lives in its own schema so it stays out of the schema
+    description and fingerprint given to the LLM. Persistence is best effort:
+    failures are logged and never fail a request.
+    """
+
+    SCHEMA = "affogato"
+    TABLE = f"{SCHEMA}.nlq_cache"
+
+    def __init__(self, db_service: "DuckDBService", max_entries: int = 1000):
+        self.db_service = db_service
+        self.max_entries = max_entries
+        self.db_service.execute_statement(f"CREATE SCHEMA IF NOT EXISTS {self.SCHEMA}")
+        self.db_service.execute_statement(
+            f"""
+            CREATE TABLE IF NOT EXISTS {self.TABLE} (
+                qhash VARCHAR PRIMARY KEY,
+                question VARCHAR NOT NULL,
+                embedding BLOB,
+                embedding_model VARCHAR,
+                embedding_dim INTEGER,
+                sql VARCHAR NOT NULL,
+                schema_fp VARCHAR NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0,
+                ts TIMESTAMP NOT NULL DEFAULT current_timestamp
+            )
+            """
+        )
+
+    @staticmethod
+    def _hash(key: str) -> str:
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+    def load(
+        self, schema_fingerprint: str, embedding_model: Optional[str] = None
+    ) -> List[Tuple[str, str, Optional[bytes]]]:
+        """Return (key, sql, embedding) rows for a schema, least recently used first.
+
+        Rows generated against any other schema version are deleted. Embeddings
+        from a model other than ``embedding_model`` are dropped, keeping their
+        rows for exact matches; without a model no embeddings are returned.
+        Only embeddings of the dimension most recently saved for the model are
+        returned, so the in-memory matrix takes the current dimension.
+        """
+        try:
+            self.db_service.execute_statement(
+                f"DELETE FROM {self.TABLE} WHERE schema_fp <> ?", [schema_fingerprint]
+            )
+            if embedding_model is not None:
+                self.db_service.execute_statement(
+                    f"""
+                    UPDATE {self.TABLE}
+                    SET embedding = NULL, embedding_model = NULL, embedding_dim = NULL
+                    WHERE embedding IS NOT NULL AND embedding_model IS DISTINCT FROM ?
+                    """,
+                    [embedding_model],
+                )
+            rows = self.db_service.execute_statement(
+                f"""
+                SELECT question, sql,
+                    CASE WHEN embedding_model = ? AND embedding_dim = (
+                        SELECT embedding_dim FROM {self.TABLE}
+                        WHERE embedding_model = ?
+                        ORDER BY ts DESC LIMIT 1
+                    ) THEN embedding END
+                FROM {self.TABLE} ORDER BY ts DESC LIMIT ?
+                """,
+                [embedding_model, embedding_model, self.max_entries],
+            )
+        except RuntimeError as e:
+            logger.warning(f"Failed to load persisted SQL cache: {e}")
+            return []
+        return rows[::-1]
+
+    def save(
+        self,
+        key: str,
+        sql: str,
+        vector: Optional[np.ndarray],
+        schema_fingerprint: str,
+        embedding_model: Optional[str] = None,
+    ) -> None:
+        """Upsert an entry and trim the table to the most recent max_entries."""
+        if vector is None or embedding_model is None:
+            embedding, embedding_model, embedding_dim = None, None, None
+        else:
+            embedding = vector.astype(np.float32).tobytes()
+            embedding_dim = int(vector.shape[0])
+        try:
+            self.db_service.execute_statement(
+                f"""
+                INSERT OR REPLACE INTO {self.TABLE}
+                    (qhash, question, embedding, sql, schema_fp, hits, ts,
+                     embedding_model, embedding_dim)
+                VALUES (?, ?, ?, ?, ?, 0, current_timestamp, ?, ?)
+                """,
+                [
+                    self._hash(key),
+                    key,
+                    embedding,
+                    sql,
+                    schema_fingerprint,
+                    embedding_model,
+                    embedding_dim,
+                ],
+            )
+            self.db_service.execute_statement(
+                f"""
+                DELETE FROM {self.TABLE} WHERE qhash NOT IN (
+                    SELECT qhash FROM {self.TABLE} ORDER BY ts DESC LIMIT ?
+                )
+                """,
+                [self.max_entries],
+            )
+        except RuntimeError as e:
+            logger.warning(f"Failed to persist SQL cache entry: {e}")
+
+    def touch(self, key: str) -> None:
+        """Record a cache hit so the entry survives LRU trimming."""
+        try:
+            self.db_service.execute_statement(
+                f"UPDATE {self.TABLE} SET hits = hits + 1, ts = current_timestamp WHERE qhash = ?",
+                [self._hash(key)],
+            )
+        except RuntimeError as e:
+            logger.warning(f"Failed to update persisted SQL cache entry: {e}")
+
+    def clear(self) -> None:
+        """Delete all persisted entries."""
+        try:
+            self.db_service.execute_statement(f"DELETE FROM {self.TABLE}")
+        except RuntimeError as e:
+            logger.warning(f"Failed to clear persisted SQL cache: {e}")
+
+
+class SQLCache:
+    """LRU cache of generated SQL with exact and semantic (embedding) lookups."""
+
+    def __init__(
+        self,
+        embeddings: Optional["Embeddings"] = None,
+        max_entries: int = 1000,
+        similarity_threshold: float = 0.92,
+        store: Optional[DuckDBSQLCacheStore] = None,
+    ):
+        self.embeddings = embeddings
+        self._embedding_model = embedding_model_id(embeddings) if embeddings is not None else None
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self._lock = threading.Lock()
+        # Normalized question -> (sql, matrix row), ordered from least to most recently used
+        self._entries: "OrderedDict[str, Tuple[str, Optional[int]]]" = OrderedDict()
+        # Preallocated (max_entries, dim) matrix of L2-normalized embeddings;
+        # unused rows are zero so they never pass the similarity threshold
+        self._vectors: Optional[np.ndarray] = None
+        self._row_keys: List[Optional[str]] = []
+        self._free_rows: List[int] = []
+        # Optional write-through persistence, scoped to one schema fingerprint;
+        # hit bookkeeping runs on a single background thread off the request path
+        self._store = store
+        self._schema_fingerprint: Optional[str] = None
+        self._executor = (
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix="sql-cache")
+            if store is not None
+            else None
+        )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def embed(self, question: str) -> Optional[np.ndarray]:
+        """Embed a question as an L2-normalized vector, or None if unavailable."""
+        if self.embeddings is None:
+            return None
+        try:
+            vector = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        except Exception as e:
+            logger.warning(f"Failed to embed question for SQL cache: {e}")
+            return None
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def lookup(
+        self, question: str, key: Optional[str] = None
+    ) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """Return cached SQL for the question (or None) and its embedding, if computed.
+
+        ``key`` is the question's ``normalize_question`` form, for callers that
+        already computed it.
+        """
+        key = key or normalize_question(question)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                logger.debug("SQL cache exact hit")
+                self._touch(key)
+                return entry[0], None
+
+        vector = self.embed(question)
+        if vector is None:
+            return None, None
+
+        with self._lock:
+            if self._vectors is None or len(self._free_rows) == len(self._row_keys):
+                return None, vector
+            if self._vectors.shape[1] != vector.shape[0]:
+                # Cached vectors came from a model with another dimension
+                return None, vector
+            sims = self._vectors @ vector
+            row = int(np.argmax(sims))
+            match_key = self._row_keys[row]
+            if match_key is None or sims[row] < self.similarity_threshold:
+                return None, vector
+            self._entries.move_to_end(match_key)
+            logger.debug(f"SQL cache semantic hit (similarity={sims[row]:.3f})")
+            self._touch(match_key)
+            return self._entries[match_key][0], vector
+
+    def store(
+        self,
+        question: str,
+        sql: str,
+        vector: Optional[np.ndarray] = None,
+        key: Optional[str] = None,
+    ) -> None:
+        """Cache SQL generated for a question, evicting the least recently used entry."""
+        key = key or normalize_question(question)
+        with self._lock:
+            self._insert(key, sql, vector)
+            schema_fingerprint = self._schema_fingerprint
+        if self._store is not None and schema_fingerprint is not None:
+            self._store.save(key, sql, vector, schema_fingerprint, self._embedding_model)
+
+    def load(self, schema_fingerprint: str) -> None:
+        """Reset the cache for a schema version, restoring entries persisted for it."""
+        rows = (
+            self._store.load(schema_fingerprint, self._embedding_model)
+            if self._store is not None
+            else []
+        )
+        with self._lock:
+            self._clear()
+            self._schema_fingerprint = schema_fingerprint
+            for key, sql, embedding in rows:
+                vector = np.frombuffer(embedding, dtype=np.float32) if embedding else None
+                self._insert(key, sql, vector)
+        if rows:
+            logger.info(f"Restored {len(rows)} persisted SQL cache entries")
+
+    def clear(self) -> None:
+        """Drop all cached entries, including persisted ones."""
+        with self._lock:
+            self._clear()
+        if self._store is not None:
+            self._store.clear()
+
+    def close(self) -> None:
+        """Wait for pending persistence work and stop the background thread."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+    def _touch(self, key: str) -> None:
+        if self._executor is not None:
+            try:
+                self._executor.submit(self._store.touch, key)
+            except RuntimeError:
+                # Executor already shut down
+                pass
+
+    def _insert(self, key: str, sql: str, vector: Optional[np.ndarray]) -> None:
+        if key in self._entries:
+            self._release(key)
+        elif len(self._entries) >= self.max_entries:
+            self._release(next(iter(self._entries)))
+
+        if (
+            vector is not None
+            and self._vectors is not None
+            and vector.shape[0] != self._vectors.shape[1]
+        ):
+            # Keep the entry for exact matches; the matrix has one dimension
+            vector = None
+        row = self._assign_row(key, vector) if vector is not None else None
+        self._entries[key] = (sql, row)
+
+    def _clear(self) -> None:
+        self._entries.clear()
+        self._vectors = None
+        self._row_keys = []
+        self._free_rows = []
+
+    def _assign_row(self, key: str, vector: np.ndarray) -> int:
+        if self._vectors is None:
+            self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+            self._row_keys = [None] * self.max_entries
+            self._free_rows = list(range(self.max_entries - 1, -1, -1))
+        row = self._free_rows.pop()
+        self._vectors[row] = vector
+        self._row_keys[row] = key
+        return row
+
+    def _release(self, key: str) -> None:
+        _, row = self._entries.pop(key)
+        if row is not None and self._vectors is not None:
+            self._vectors[row] = 0.0
+            self._row_keys[row] = None
+            self._free_rows.append(row)
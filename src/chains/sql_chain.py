@@ -1,34 +1,43 @@
 import re
+import threading
 import time
+from concurrent.futures import Future
 from functools import lru_cache
-from typing import TYPE_CHECKING, Optional
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Union
 
-from langchain.prompts import PromptTemplate
-from langchain_core.runnables import RunnablePassthrough
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
 
+from src.chains.batcher import MicroBatcher
+from src.chains.sql_cache import DuckDBSQLCacheStore, SQLCache, normalize_question
 from src.core.logger import logger
 
 if TYPE_CHECKING:
+    from langchain_core.embeddings import Embeddings
+
     from src.services.database_service import DuckDBService
 
+# Statements that must never appear in generated SQL, plus stacked statements
+# (anything after a ';'), checked in a single case-insensitive pass. RE2
+# matches in linear time without backtracking, so it is used when installed.
+_UNSAFE_PATTERN = (
+    r"(?i)\b(?:drop|delete|update|insert|alter|create|truncate)\b|;\s*\S"
+)
+try:
+    import re2
 
-class SQLChainManager:
-    """Manager for SQL chain operations with caching and optimization."""
+    _UNSAFE_RE = re2.compile(_UNSAFE_PATTERN)
+except ImportError:
+    _UNSAFE_RE = re.compile(_UNSAFE_PATTERN)
 
-    def __init__(self, llm, db_service: "DuckDBService"):
-        self.llm = llm
-        self.db_service = db_service
-        self._cached_schema: Optional[str] = None
-        self._schema_cache_time: Optional[float] = None
-        self._cache_ttl = 300  # 5 minutes cache TTL
+# Fenced code blocks in LLM output; ``lang`` is set for ```sql fences, which
+# are preferred over generic ones found in the same scan
+_FENCE_RE = re.compile(
+    r"```(?P<lang>sql\b)?\s*(?P<body>.*?)\s*```", re.DOTALL | re.IGNORECASE
+)
 
-        # Enhanced prompt for better SQL generation
-        self.sql_prompt = PromptTemplate(
-            input_variables=["schema", "question"],
-            template="""You are an expert SQL developer specializing in DuckDB. Convert the following natural language query to a valid DuckDB SQL query.
 
-Database Schema:
-{schema}
+_SQL_SYSTEM_PROMPT = """You are an expert SQL developer specializing in DuckDB. Convert the user's natural language query to a valid DuckDB SQL query.
 
 Instructions:
 - Generate only the SQL query, no explanations
@@ -38,84 +47,123 @@ Instructions:
 - Handle NULL values properly
 - Limit results to reasonable sizes (use LIMIT if appropriate)
 
-Question: {question}
+Database Schema:
+{schema}"""
 
-SQL Query:""",
-        )
 
-        self.chain = (
-            {"schema": RunnablePassthrough(), "question": RunnablePassthrough()}
-            | self.sql_prompt
-            | llm
-            | (lambda x: str(x))
+class SQLChainManager:
+    """Manager for SQL chain operations with caching and optimization."""
+
+    def __init__(
+        self,
+        llm,
+        db_service: "DuckDBService",
+        embeddings: Optional["Embeddings"] = None,
+        max_batch_size: int = 1,
+        batch_wait_ms: float = 15.0,
+        persist_cache: bool = False,
+    ):
+        self.llm = llm
+        self.db_service = db_service
+        # Fingerprint of the schema the generated SQL cache belongs to
+        self._schema_fingerprint: Optional[str] = None
+        # Schema descriptions keyed by fingerprint, bounded in case the
+        # database flips between a few schema versions
+        self._schema_for_fingerprint = lru_cache(maxsize=4)(self._load_schema)
+        # Generated SQL keyed by question; semantic matching when embeddings are
+        # set, optionally persisted in the database so it survives restarts
+        cache_store: Optional[DuckDBSQLCacheStore] = None
+        if persist_cache:
+            try:
+                cache_store = DuckDBSQLCacheStore(db_service)
+            except RuntimeError as e:
+                logger.warning(f"SQL cache persistence disabled: {e}")
+        self.sql_cache = SQLCache(embeddings, store=cache_store)
+        # In-flight generations keyed by normalized question, so concurrent
+        # identical questions share a single LLM call
+        self._inflight: Dict[str, "Future[str]"] = {}
+        self._inflight_lock = threading.Lock()
+        # Micro-batch LLM calls from concurrent requests when batching is enabled
+        self._batcher: Optional[MicroBatcher[Dict[str, Any], Any]] = None
+        if max_batch_size > 1:
+            self._batcher = MicroBatcher(
+                self._invoke_batch, max_batch_size, batch_wait_ms / 1000
+            )
+
+        # Prompt split so the invariant part (instructions + schema) forms a
+        # stable system-message prefix shared by every request, which lets the
+        # provider reuse its prompt cache; only the user message varies.
+        self.sql_prompt = ChatPromptTemplate.from_messages(
+            [
+                ("system", _SQL_SYSTEM_PROMPT),
+                ("human", "Question: {question}\n\nSQL Query:"),
+            ]
         )
 
+        self.chain = self.sql_prompt | llm | StrOutputParser()
+
+    def _invoke_batch(
+        self, inputs: List[Dict[str, Any]]
+    ) -> Sequence[Union[Any, Exception]]:
+        """Run a batch of chain inputs concurrently, returning per-input errors."""
+        return self.chain.batch(inputs, return_exceptions=True)
+
+    def _load_schema(self, fingerprint: str) -> str:
+        """Read the schema description; the fingerprint only keys the cache.
+
+        Failures raise, so a transient error is never cached for the fingerprint.
+        """
+        logger.debug("Schema information cached/refreshed")
+        return self.db_service.get_table_info()
+
     def _get_schema_info(self) -> str:
-        """Retrieve and cache schema information with TTL."""
-        current_time = time.time()
-        if (
-            self._cached_schema is None
-            or self._schema_cache_time is None
-            or (current_time - self._schema_cache_time) > self._cache_ttl
-        ):
-            try:
-                self._cached_schema = self.db_service.get_table_info()
-                self._schema_cache_time = current_time
-                logger.debug("Schema information cached/refreshed")
-            except Exception as e:
-                logger.error(f"Failed to retrieve schema info: {e}")
-                raise RuntimeError(f"Failed to retrieve schema info: {e}")
-        return self._cached_schema
+        """Retrieve schema information, rebuilding it only when the schema changes."""
+        try:
+            fingerprint = self.db_service.schema_fingerprint()
+            if fingerprint != self._schema_fingerprint:
+                # SQL generated against another schema may no longer be valid;
+                # only entries persisted for this fingerprint are restored
+                self.sql_cache.load(fingerprint)
+                self._schema_fingerprint = fingerprint
+            return self._schema_for_fingerprint(fingerprint)
+        except Exception as e:
+            logger.error(f"Failed to retrieve schema info: {e}")
+            raise RuntimeError(f"Failed to retrieve schema info: {e}")
 
     @staticmethod
-    @lru_cache(maxsize=100)
     def _clean_sql_output(raw_output: str) -> str:
-        """Clean and extract SQL from LLM output with caching for repeated outputs."""
-        result = raw_output.strip()
+        """Clean and extract SQL from LLM output."""
+        result = raw_output
 
         # Remove thinking tags if present
-        if "<think>" in result and "</think>" in result:
-            parts = result.split("</think>")
-            if len(parts) > 1:
-                result = parts[1].strip()
-
-        # Extract SQL from code blocks
-        sql_match = re.search(
-            r"```sql\s*(.*?)\s*```", result, re.DOTALL | re.IGNORECASE
-        )
-        if sql_match:
-            return sql_match.group(1).strip()
-
-        # Fallback: extract from generic code blocks
-        code_match = re.search(r"```\s*(.*?)\s*```", result, re.DOTALL)
-        if code_match:
-            return code_match.group(1).strip()
+        if "<think>" in result:
+            _, closed, after = result.partition("</think>")
+            if closed:
+                result = after
+
+        # Extract SQL from code blocks, falling back to the first generic block
+        generic_body = None
+        for match in _FENCE_RE.finditer(result):
+            if match.group("lang"):
+                return match.group("body")
+            if generic_body is None:
+                generic_body = match.group("body")
+        if generic_body is not None:
+            return generic_body
 
         # If no code blocks, assume the entire output is SQL
-        return result
+        return result.strip()
 
     def _validate_generated_sql(self, sql: str) -> bool:
         """Basic validation of generated SQL."""
-        sql_lower = sql.lower().strip()
-
-        # Must be SELECT query
-        if not sql_lower.startswith("select"):
+        # Must be a read-only query (plain SELECT or a CTE)
+        if not sql.lstrip()[:6].lower().startswith(("select", "with")):
             return False
 
         # Check for dangerous patterns (shouldn't happen with proper prompting)
-        dangerous = [
-            "drop",
-            "delete",
-            "update",
-            "insert",
-            "alter",
-            "create",
-            "truncate",
-        ]
-        for word in dangerous:
-            if re.search(r"\b" + word + r"\b", sql_lower):
-                logger.warning(f"Potentially dangerous SQL generated: {sql[:100]}...")
-                return False
+        if _UNSAFE_RE.search(sql):
+            logger.warning(f"Potentially dangerous SQL generated: {sql[:100]}...")
+            return False
 
         return True
 
@@ -126,12 +174,41 @@ SQL Query:""",
 
         try:
             schema = self._get_schema_info()
-            raw_result = self.chain.invoke({"schema": schema, "question": question})
-            cleaned_sql = self._clean_sql_output(raw_result)
+            # Normalize once; the key is shared by the cache and in-flight lookups
+            key = normalize_question(question)
+            cached_sql, question_vector = self.sql_cache.lookup(question, key)
+            if cached_sql is not None:
+                logger.debug(f"Using cached SQL for question: {question[:100]}...")
+                return cached_sql
+
+            with self._inflight_lock:
+                inflight = self._inflight.get(key)
+                if inflight is None:
+                    future: "Future[str]" = Future()
+                    self._inflight[key] = future
+            if inflight is not None:
+                logger.debug(f"Awaiting in-flight SQL generation: {question[:100]}...")
+                return inflight.result()
 
-            # Validate the generated SQL
-            if not self._validate_generated_sql(cleaned_sql):
-                raise ValueError("Generated SQL failed validation")
+            try:
+                chain_input = {"schema": schema, "question": question}
+                if self._batcher is not None:
+                    raw_result = self._batcher.submit(chain_input)
+                else:
+                    raw_result = self.chain.invoke(chain_input)
+                cleaned_sql = self._clean_sql_output(raw_result)
+
+                # Validate the generated SQL
+                if not self._validate_generated_sql(cleaned_sql):
+                    raise ValueError("Generated SQL failed validation")
+                self.sql_cache.store(question, cleaned_sql, question_vector, key)
+                future.set_result(cleaned_sql)
+            except Exception as e:
+                future.set_exception(e)
+                raise
+            finally:
+                with self._inflight_lock:
+                    del self._inflight[key]
 
             processing_time = time.time() - start_time
             logger.debug(
@@ -146,9 +223,20 @@ SQL Query:""",
             )
             raise RuntimeError(f"Failed to generate SQL query: {e}")
 
+    def warm_up(self) -> None:
+        """Prime the schema cache so the first request doesn't pay for it."""
+        self._get_schema_info()
+        logger.info("SQL chain schema cache warmed up")
+
     def clear_cache(self) -> None:
-        """Clear the schema cache."""
-        self._cached_schema = None
-        self._schema_cache_time = None
-        self._clean_sql_output.cache_clear()
+        """Clear the schema and generated SQL caches."""
+        self._schema_for_fingerprint.cache_clear()
+        self._schema_fingerprint = None
+        self.sql_cache.clear()
         logger.info("SQL chain cache cleared")
+
+    def close(self) -> None:
+        """Stop the background micro-batcher and cache writer, if running."""
+        if self._batcher is not None:
+            self._batcher.close()
+        self.sql_cache.close()
@@ -48,8 +48,24 @@ def create_services(
     db_service = DuckDBService(str(db_path_obj))
     logger.info(f"Database service initialized with path: {db_path_obj}")
 
+    # Optional embedding model for semantic SQL caching of paraphrased questions
+    embeddings = None
+    embedding_model = os.getenv("EMBEDDING_MODEL")
+    if embedding_model:
+        from langchain_community.embeddings import FastEmbedEmbeddings
+
+        embeddings = FastEmbedEmbeddings(model_name=embedding_model)
+        logger.info(f"Semantic SQL cache enabled with model: {embedding_model}")
+
     # Initialize SQL chain manager
-    sql_chain = SQLChainManager(llm, db_service)
+    sql_chain = SQLChainManager(
+        llm,
+        db_service,
+        embeddings=embeddings,
+        max_batch_size=int(os.getenv("NLQ_BATCH_SIZE", "1")),
+        batch_wait_ms=float(os.getenv("NLQ_BATCH_WAIT_MS", "15")),
+        persist_cache=os.getenv("NLQ_CACHE_PERSIST", "false").lower() == "true",
+    )
     logger.info("SQL chain manager initialized")
 
     return db_service, sql_chain
@@ -60,9 +76,15 @@ def get_config() -> dict:
     return {
         "groq_api_key": os.getenv("GROQ_API_KEY"),
         "groq_model": os.getenv("GROQ_MODEL", "llama-3.1-8b-instant"),
+        "embedding_model": os.getenv("EMBEDDING_MODEL"),
+        "nlq_batch_size": int(os.getenv("NLQ_BATCH_SIZE", "1")),
+        "nlq_batch_wait_ms": float(os.getenv("NLQ_BATCH_WAIT_MS", "15")),
+        "nlq_cache_persist": os.getenv("NLQ_CACHE_PERSIST", "false").lower() == "true",
         "db_path": os.getenv("DATABASE_PATH", "data/database.db"),
         "log_level": os.getenv("LOG_LEVEL", "INFO"),
         "max_query_rows": int(os.getenv("MAX_QUERY_ROWS", "10000")),
         "rate_limit_requests": int(os.getenv("RATE_LIMIT_REQUESTS", "5")),
         "rate_limit_window": int(os.getenv("RATE_LIMIT_WINDOW", "60")),  # seconds
+        "rate_limit_storage_uri": os.getenv("RATE_LIMIT_STORAGE_URI", "memory://"),
+        "rate_limit_strategy": os.getenv("RATE_LIMIT_STRATEGY", "fixed-window"),
     }
@@ -1,6 +1,11 @@
+import os
+
+from dotenv import load_dotenv
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 
+load_dotenv()
+
 
 def get_request_key(request):
     # Allow tests to set a unique key via header to isolate rate limits per TestClient
@@ -13,5 +18,13 @@ def get_request_key(request):
     return get_remote_address(request)
 
 
-# Shared limiter instance used across the app and endpoints
-limiter = Limiter(key_func=get_request_key)
+# Shared limiter instance used across the app and endpoints. Counters live in
+# process memory by default; point RATE_LIMIT_STORAGE_URI at Redis (e.g.
+# redis://localhost:6379/0) so limits are enforced across all Uvicorn workers.
+limiter = Limiter(
+    key_func=get_request_key,
+    storage_uri=os.getenv("RATE_LIMIT_STORAGE_URI", "memory://"),
+    strategy=os.getenv("RATE_LIMIT_STRATEGY", "fixed-window"),
+    # Keep limiting per worker if the shared storage becomes unreachable
+    in_memory_fallback_enabled=True,
+)
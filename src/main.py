@@ -4,6 +4,7 @@ from typing import Optional, Tuple
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
+from pydantic import BaseModel
 from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 from slowapi.middleware import SlowAPIMiddleware
@@ -16,28 +17,38 @@ from .core.database import create_services
 from .core.logger import logger
 from .services.database_service import DuckDBService
 
-# Global services cache with proper typing
-services: Optional[Tuple[DuckDBService, SQLChainManager]] = None
-
 # Rate limiter (shared instance imported from src.core.rate_limit)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Manage application lifespan: startup and shutdown."""
-    global services
     logger.info("Starting Affogato API")
+    services: Optional[Tuple[DuckDBService, SQLChainManager]] = None
     try:
         services = create_services()
+        # Endpoints receive the services through get_services dependencies
+        app.state.services = services
         logger.info("Services initialized successfully")
+
+        # Open the DuckDB connection and build the schema description now
+        # rather than on the first user request
+        db_service, sql_chain = services
+        try:
+            db_service.execute_query("SELECT 1")
+            sql_chain.warm_up()
+        except Exception as e:
+            logger.warning(f"Service warm-up failed: {e}")
         yield
     except Exception as e:
         logger.error(f"Failed to initialize services: {e}")
         raise
     finally:
         logger.info("Shutting down Affogato API")
+        app.state.services = None
         if services:
-            db_service, _ = services
+            db_service, sql_chain = services
+            sql_chain.close()
             db_service.close()
             logger.info("Database connection closed")
 
@@ -48,6 +59,8 @@ app = FastAPI(
     version="1.0.0",
     lifespan=lifespan,
 )
+# Populated by lifespan; None until services are initialized
+app.state.services = None
 
 # Add CORS middleware
 app.add_middleware(
@@ -70,25 +83,44 @@ app.include_router(query_router, prefix="/api", tags=["query"])
 app.include_router(chat_router, prefix="/api", tags=["chat"])
 
 
+class RootResponse(BaseModel):
+    """Response model for the root endpoint."""
+
+    message: str
+    version: str
+    status: str
+
+
+class HealthResponse(BaseModel):
+    """Response model for the health check endpoint."""
+
+    status: str
+    services: str
+
+
+# Every route declares a response model so FastAPI serializes responses
+# directly to JSON bytes with pydantic-core instead of the stdlib encoder.
+
+
 @app.get("/")
 @limiter.limit("10/minute")
-async def root(request: Request):
+async def root(request: Request) -> RootResponse:
     """Root endpoint with basic health check."""
-    return {
-        "message": "Welcome to Affogato Platform",
-        "version": "1.0.0",
-        "status": "healthy",
-    }
+    return RootResponse(
+        message="Welcome to Affogato Platform",
+        version="1.0.0",
+        status="healthy",
+    )
 
 
 @app.get("/health")
 @limiter.limit("30/minute")
-async def health_check(request: Request):
+async def health_check(request: Request) -> HealthResponse:
     """Health check endpoint."""
-    return {
-        "status": "healthy",
-        "services": "initialized" if services else "not initialized",
-    }
+    return HealthResponse(
+        status="healthy",
+        services="initialized" if request.app.state.services else "not initialized",
+    )
 
 
 if __name__ == "__main__":
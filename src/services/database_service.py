@@ -1,12 +1,128 @@
+import re
+import threading
 import time
 from contextlib import contextmanager
+from functools import lru_cache
+from itertools import groupby
+from operator import itemgetter
 from pathlib import Path
-from typing import Any, Dict, Generator, List, Optional, cast
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Generator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+    Union,
+)
 
+import sqlglot
 from duckdb import DuckDBPyConnection, connect
+from sqlglot import exp
 
 from src.core.logger import logger
 
+if TYPE_CHECKING:
+    import pandas as pd
+    import pyarrow as pa
+
+_Result = TypeVar("_Result")
+
+# A scalar DECIMAL column type, e.g. DECIMAL(18,3) but not DECIMAL(18,3)[]
+_DECIMAL_TYPE_RE = re.compile(r"DECIMAL\(\d+,\s*\d+\)")
+
+# Statements that can change the catalog or the current schema. Matching is
+# deliberately loose: a false positive only costs one extra catalog scan.
+_DDL_RE = re.compile(
+    r"\b(?:create|drop|alter|attach|detach|import|use|search_path)\b", re.IGNORECASE
+)
+
+
+@lru_cache(maxsize=512)
+def _apply_row_limit(query: str, max_rows: int) -> str:
+    """Add a top-level LIMIT to a single query that has none, via the SQL AST."""
+    try:
+        statements = sqlglot.parse(query, dialect="duckdb")
+    except sqlglot.errors.SqlglotError:
+        # Leave unparseable SQL to DuckDB; fetchmany still caps the rows
+        return query
+
+    if len(statements) != 1:
+        return query
+    tree = statements[0]
+    if not isinstance(tree, exp.Query) or tree.args.get("limit") is not None:
+        return query
+    return tree.limit(max_rows, copy=False).sql(dialect="duckdb")
+
+
+def _quote_identifier(name: str) -> str:
+    """Quote a possibly schema-qualified table name for use in SQL."""
+    return ".".join('"' + part.replace('"', '""') + '"' for part in name.split("."))
+
+
+def _decimal_columns(description: Sequence[Tuple[Any, ...]]) -> List[int]:
+    """Return the positions of scalar DECIMAL columns in a cursor description."""
+    # Nested types such as DECIMAL(4,2)[] hold lists, not Decimal values
+    return [
+        i
+        for i, column in enumerate(description)
+        if _DECIMAL_TYPE_RE.fullmatch(str(column[1]))
+    ]
+
+
+def _decimals_to_float(row: Tuple[Any, ...], positions: List[int]) -> Tuple[Any, ...]:
+    """Convert a row's DECIMAL values to float, as the former pandas path did.
+
+    Decimal objects serialize as JSON strings, so API clients would otherwise
+    receive "9.99" where they used to get 9.99.
+    """
+    values = list(row)
+    for i in positions:
+        if values[i] is not None:
+            values[i] = float(values[i])
+    return tuple(values)
+
+
+def _fetch_records(
+    cursor: DuckDBPyConnection, max_rows: Optional[int]
+) -> List[Dict[str, Any]]:
+    """Read at most max_rows result rows as dicts keyed by column name."""
+    if cursor.description is None:
+        return []
+    # Build dict records straight from DuckDB's row tuples rather than
+    # materializing an intermediate pandas DataFrame; fetchmany caps the rows
+    # even when no LIMIT could be injected
+    columns = [column[0] for column in cursor.description]
+    rows = cursor.fetchmany(max_rows) if max_rows else cursor.fetchall()
+    decimals = _decimal_columns(cursor.description)
+    if decimals:
+        rows = [_decimals_to_float(row, decimals) for row in rows]
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def _fetch_arrow(cursor: DuckDBPyConnection, max_rows: Optional[int]) -> "pa.Table":
+    """Read at most max_rows result rows as an Arrow table."""
+    if not max_rows:
+        return cursor.to_arrow_table()
+
+    import pyarrow as pa
+
+    # Stream record batches so a query that kept no LIMIT is never fully
+    # materialized just to be cut down to max_rows
+    reader = cursor.to_arrow_reader(max_rows)
+    batches = []
+    fetched = 0
+    for batch in reader:
+        batches.append(batch)
+        fetched += batch.num_rows
+        if fetched >= max_rows:
+            break
+    return pa.Table.from_batches(batches, schema=reader.schema).slice(0, max_rows)
+
 
 class DuckDBService:
     """Service for managing DuckDB database operations."""
@@ -14,45 +130,86 @@ class DuckDBService:
     def __init__(self, db_path: str, max_rows: int = 10000):
         self.db_path = Path(db_path)
         self.connection: Optional[DuckDBPyConnection] = None
+        self._connection_lock = threading.Lock()
         self.max_rows = max_rows
+        # Schema description and fingerprint, each tagged with the DDL version
+        # it was computed at; any DDL run through this service bumps the version
+        self._schema_cache: Dict[str, Tuple[int, str]] = {}
+        self._ddl_version = 0
+        self._ddl_lock = threading.Lock()
         logger.info(f"DuckDBService initialized with path: {db_path}")
 
+    def _connect(self) -> DuckDBPyConnection:
+        """Open the shared connection on first use and apply settings once."""
+        with self._connection_lock:
+            if self.connection is None:
+                try:
+                    conn = connect(str(self.db_path))
+                except Exception as e:
+                    logger.error(f"Failed to create database connection: {e}")
+                    raise RuntimeError(f"Failed to initialize DuckDB connection: {e}")
+                try:
+                    # Set some performance optimizations
+                    conn.execute("SET threads = 1")  # Single thread for safety
+                    conn.execute("SET memory_limit = '512MB'")  # Memory limit
+                except Exception as e:
+                    conn.close()
+                    logger.error(f"Failed to configure database connection: {e}")
+                    raise RuntimeError(f"Failed to initialize DuckDB connection: {e}")
+                self.connection = conn
+                logger.debug("Database connection established")
+            return self.connection
+
+    def invalidate_schema_cache(self) -> None:
+        """Force the next schema lookups to re-read the catalog."""
+        with self._ddl_lock:
+            self._ddl_version += 1
+
+    def _cached_schema_value(self, name: str) -> Tuple[int, Optional[str]]:
+        """Return the current DDL version and the value cached for it, if any."""
+        version = self._ddl_version
+        cached = self._schema_cache.get(name)
+        if cached is not None and cached[0] == version:
+            return version, cached[1]
+        return version, None
+
     @contextmanager
     def _get_connection(self) -> Generator[DuckDBPyConnection, None, None]:
-        """Context manager for database connection with connection pooling."""
-        # Create a fresh connection for each context use to avoid leaving file
-        # handles open on Windows. After the context is exited, store a
-        # reference to the (now-closed) connection object in self.connection so
-        # tests that inspect the attribute still see a value.
+        """Context manager yielding a cursor on the shared database connection."""
+        # A DuckDB connection must not be used from several threads at once,
+        # but cursors are independent, cheap handles on the same database.
+        cursor = self._connect().cursor()
         try:
-            conn = connect(str(self.db_path))
-            # Set some performance optimizations
-            conn.execute("SET threads = 1")  # Single thread for safety
-            conn.execute("SET memory_limit = '512MB'")  # Memory limit
-            logger.debug("Database connection established")
-        except Exception as e:
-            logger.error(f"Failed to create database connection: {e}")
-            raise RuntimeError(f"Failed to initialize DuckDB connection: {e}")
-
-        try:
-            yield conn
+            yield cursor
         except Exception as e:
             logger.error(f"Database operation failed: {e}")
             raise
         finally:
-            # Close the connection to release file handles, but keep a reference
-            # to the connection object (closed) so other parts of the code/tests
-            # can introspect it if needed.
-            try:
-                conn.close()
-            except Exception as e:
-                logger.debug(f"Error closing temporary connection: {e}")
-            self.connection = conn
+            cursor.close()
 
     def execute_query(
         self, query: str, max_rows: Optional[int] = None
     ) -> List[Dict[str, Any]]:
         """Execute a SQL query and return results as list of dicts with safety limits."""
+        return self._run_query(query, max_rows, _fetch_records)
+
+    def execute_query_arrow(
+        self, query: str, max_rows: Optional[int] = None
+    ) -> "pa.Table":
+        """Execute a SQL query and return results as a columnar Arrow table.
+
+        Same row limits as execute_query, but without building a Python
+        object per cell; for consumers that work on columns (pandas, Arrow IPC).
+        """
+        return self._run_query(query, max_rows, _fetch_arrow)
+
+    def _run_query(
+        self,
+        query: str,
+        max_rows: Optional[int],
+        fetch: Callable[[DuckDBPyConnection, Optional[int]], _Result],
+    ) -> _Result:
+        """Run a query with the row limit applied and read its results with fetch."""
         max_rows = max_rows or self.max_rows
         logger.debug(f"Executing query: {query[:100]}...")
 
@@ -60,74 +217,161 @@ class DuckDBService:
 
         try:
             with self._get_connection() as conn:
-                # Only add LIMIT for SELECT queries
-                query_upper = query.upper().strip()
-                if (
-                    max_rows
-                    and query_upper.startswith("SELECT")
-                    and not query_upper.endswith(f"LIMIT {max_rows}")
-                    and "LIMIT" not in query_upper
-                ):
-                    query = f"{query.rstrip(';')} LIMIT {max_rows}"
+                if max_rows:
+                    query = _apply_row_limit(query, max_rows)
+                results = fetch(conn.execute(query), max_rows)
 
-                result_df = conn.execute(query).fetchdf()
-
-                # Convert to dict records
-                results = cast(List[Dict[str, Any]], result_df.to_dict("records"))
-
-                execution_time = time.time() - start_time
-                logger.debug(
-                    f"Query executed successfully, returned {len(results)} rows in {execution_time:.2f}s"
-                )
-
-                return results
+            execution_time = time.time() - start_time
+            logger.debug(
+                f"Query executed successfully, returned {len(results)} rows in {execution_time:.2f}s"
+            )
+            return results
 
         except Exception as e:
             execution_time = time.time() - start_time
             logger.error(f"Failed to execute query after {execution_time:.2f}s: {e}")
             raise RuntimeError(f"Failed to execute query: {e}")
+        finally:
+            # Invalidate only once the statement has run, so a concurrent
+            # lookup can't cache the pre-DDL schema under the new version
+            if _DDL_RE.search(query):
+                self.invalidate_schema_cache()
+
+    def execute_statement(
+        self, statement: str, parameters: Optional[Sequence[Any]] = None
+    ) -> List[Tuple[Any, ...]]:
+        """Execute an internal statement with bound parameters and return raw rows.
+
+        Unlike execute_query, no LIMIT is injected and rows are not capped.
+        """
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.execute(statement, parameters)
+                return cursor.fetchall() if cursor.description is not None else []
+        except Exception as e:
+            logger.error(f"Failed to execute statement: {e}")
+            raise RuntimeError(f"Failed to execute statement: {e}")
+        finally:
+            if _DDL_RE.search(statement):
+                self.invalidate_schema_cache()
+
+    def bulk_insert(
+        self,
+        table: str,
+        rows: Union[List[Dict[str, Any]], "pd.DataFrame", "pa.Table"],
+    ) -> int:
+        """Insert many rows into an existing table in one columnar batch.
+
+        Rows are matched to the table's columns by name. Prefer batches of
+        tens of thousands of rows over many small calls.
+        """
+        count = len(rows)
+        if not count:
+            return 0
+
+        try:
+            if isinstance(rows, list):
+                # Imported here so pyarrow is only loaded by callers that need it
+                import pyarrow as pa
+
+                rows = pa.Table.from_pylist(rows)
+            with self._get_connection() as conn:
+                # DuckDB scans the registered Arrow table or DataFrame directly,
+                # so the whole batch is parsed and planned once instead of per row
+                conn.register("_bulk_rows", rows)
+                try:
+                    conn.execute(
+                        f"INSERT INTO {_quote_identifier(table)} BY NAME SELECT * FROM _bulk_rows"
+                    )
+                finally:
+                    conn.unregister("_bulk_rows")
+            logger.debug(f"Bulk inserted {count} rows into {table}")
+            return count
+        except Exception as e:
+            logger.error(f"Failed to bulk insert into {table}: {e}")
+            raise RuntimeError(f"Failed to bulk insert into {table}: {e}")
 
     def get_table_info(self) -> str:
         """Get schema information for all tables with enhanced formatting."""
+        version, cached = self._cached_schema_value("table_info")
+        if cached is not None:
+            return cached
+
         logger.debug("Retrieving table schema information")
         try:
             with self._get_connection() as conn:
-                tables_df = conn.execute("SHOW TABLES").fetchdf()
-
-                if tables_df.empty:
-                    return "No tables found in database."
-
-                schema_info = []
-                for table_name in tables_df["name"]:
-                    try:
-                        columns_df = conn.execute(f"DESCRIBE {table_name}").fetchdf()
-                        columns_str = ", ".join(
-                            f"{row['column_name']} ({row['column_type']})"
-                            for _, row in columns_df.iterrows()
-                        )
-                        schema_info.append(
-                            f"Table: {table_name}\nColumns: {columns_str}"
-                        )
-                    except Exception as e:
-                        logger.warning(f"Could not describe table {table_name}: {e}")
-                        schema_info.append(
-                            f"Table: {table_name}\nColumns: [Error retrieving schema]"
-                        )
-
-                schema = "\n\n".join(schema_info)
-                logger.debug("Schema information retrieved successfully")
+                # One catalog query for every table's columns instead of
+                # SHOW TABLES followed by a DESCRIBE per table
+                rows = conn.execute(
+                    """
+                    SELECT table_name, column_name, data_type
+                    FROM information_schema.columns
+                    WHERE table_catalog = current_database()
+                      AND table_schema = current_schema()
+                    ORDER BY table_name, ordinal_position
+                    """
+                ).fetchall()
+
+            if not rows:
+                schema = "No tables found in database."
+                self._schema_cache["table_info"] = (version, schema)
                 return schema
 
+            schema_info = [
+                f"Table: {table_name}\nColumns: "
+                + ", ".join(f"{column} ({data_type})" for _, column, data_type in columns)
+                for table_name, columns in groupby(rows, key=itemgetter(0))
+            ]
+
+            schema = "\n\n".join(schema_info)
+            self._schema_cache["table_info"] = (version, schema)
+            logger.debug("Schema information retrieved successfully")
+            return schema
+
         except Exception as e:
             logger.error(f"Error retrieving schema: {e}")
-            return f"Error retrieving schema: {e}"
+            raise RuntimeError(f"Failed to retrieve schema: {e}")
+
+    def schema_fingerprint(self) -> str:
+        """Get a cheap checksum of the current schema's tables, columns and types."""
+        version, cached = self._cached_schema_value("fingerprint")
+        if cached is not None:
+            return cached
+
+        try:
+            with self._get_connection() as conn:
+                result = conn.execute(
+                    """
+                    SELECT md5(coalesce(string_agg(
+                        table_name || '.' || column_name || ':' || data_type, ','
+                        ORDER BY table_name, ordinal_position
+                    ), ''))
+                    FROM information_schema.columns
+                    WHERE table_catalog = current_database()
+                      AND table_schema = current_schema()
+                    """
+                ).fetchone()
+            fingerprint = result[0] if result else ""
+            self._schema_cache["fingerprint"] = (version, fingerprint)
+            return fingerprint
+        except Exception as e:
+            logger.error(f"Error computing schema fingerprint: {e}")
+            raise RuntimeError(f"Failed to compute schema fingerprint: {e}")
 
     def get_table_count(self) -> int:
         """Get the number of tables in the database."""
         try:
             with self._get_connection() as conn:
+                # Scoped like get_table_info so internal tables (e.g. the
+                # persisted SQL cache) are not counted
                 result = conn.execute(
-                    "SELECT COUNT(*) as count FROM information_schema.tables WHERE table_type = 'BASE TABLE'"
+                    """
+                    SELECT COUNT(*) as count
+                    FROM information_schema.tables
+                    WHERE table_type = 'BASE TABLE'
+                      AND table_catalog = current_database()
+                      AND table_schema = current_schema()
+                    """
                 ).fetchone()
                 return result[0] if result else 0
         except Exception as e:
@@ -136,17 +380,16 @@ class DuckDBService:
 
     def close(self) -> None:
         """Close the database connection."""
-        if self.connection:
+        with self._connection_lock:
+            if self.connection is None:
+                return
             try:
-                # Attempt to close if it's still open; ignore errors for already-closed
-                try:
-                    self.connection.close()
-                except Exception:
-                    pass
-                self.connection = None
+                self.connection.close()
                 logger.info("Database connection closed")
             except Exception as e:
                 logger.error(f"Error closing database connection: {e}")
+            finally:
+                self.connection = None
 
     def __del__(self):
         """Destructor to ensure connection is closed."""
@@ -0,0 +1,97 @@
+import time
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src.api.dependencies import get_services
+from src.main import app
+from src.services.database_service import DuckDBService
+
+# Shared by every test; tests replace results rather than mutate this
+_MOCK_USERS = [
+    {"id": 1, "name": "Alice", "email": "alice@example.com"},
+    {"id": 2, "name": "Bob", "email": "bob@example.com"},
+]
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _warm_up():
+    """Pay one-time app and DuckDB initialization before the first test runs."""
+    # No lifespan (not used as a context manager), so no real services are
+    # created; the request uses the client's own rate-limit key, not a test's
+    TestClient(app).get("/health")
+    service = DuckDBService(":memory:")
+    service.execute_query("SELECT 1")
+    service.close()
+
+
+@pytest.fixture(scope="module")
+def _client():
+    """Test client for FastAPI app, shared by each test module's tests."""
+    return TestClient(app)
+
+
+@pytest.fixture
+def client(_client):
+    """Shared test client with a fresh rate-limit key per test."""
+    # Provide a unique header so the shared limiter won't collide across tests
+    _client.headers["x-test-id"] = str(uuid.uuid4())
+    return _client
+
+
+class StubDB:
+    """Stand-in for DuckDBService's execute_query, recording (query, max_rows) calls."""
+
+    def __init__(self):
+        self.calls = []
+        self.set()
+
+    def set(self, results=_MOCK_USERS, error=None, delay=0.0):
+        """Configure the rows returned, an exception to raise and a delay per call."""
+        self.results = results
+        self.error = error
+        self.delay = delay
+        return self
+
+    def execute_query(self, query, max_rows=None):
+        self.calls.append((query, max_rows))
+        if self.delay:
+            time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return self.results
+
+
+class StubChain:
+    """Stand-in for SQLChainManager's natural_language_to_sql, recording (question,) calls."""
+
+    def __init__(self):
+        self.calls = []
+        self.set()
+
+    def set(self, sql="SELECT * FROM users;", error=None):
+        """Configure the generated SQL or an exception to raise."""
+        self.sql = sql
+        self.error = error
+        return self
+
+    def natural_language_to_sql(self, question):
+        self.calls.append((question,))
+        if self.error is not None:
+            raise self.error
+        return self.sql
+
+
+@pytest.fixture
+def mock_services():
+    """Stub services for testing; plain objects avoid Mock spec introspection."""
+    return StubDB(), StubChain()
+
+
+@pytest.fixture
+def patched_services(mock_services, monkeypatch):
+    """Stub services injected into the chat and query endpoints for one test."""
+    # Both routers share the dependency; monkeypatch reverts the override
+    monkeypatch.setitem(app.dependency_overrides, get_services, lambda: mock_services)
+    return mock_services
@@ -0,0 +1,81 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import Mock
+
+import pytest
+
+from src.chains.batcher import MicroBatcher
+
+
+class TestMicroBatcher:
+    @pytest.fixture
+    def batch_fn(self):
+        """Batch function doubling each item and recording batch sizes."""
+        return Mock(side_effect=lambda items: [item * 2 for item in items])
+
+    def test_submit_single_item(self, batch_fn):
+        """Test that a lone item is processed after the wait window."""
+        batcher = MicroBatcher(batch_fn, max_batch_size=4, max_wait=0.001)
+        try:
+            assert batcher.submit(21) == 42
+        finally:
+            batcher.close()
+        batch_fn.assert_called_once_with([21])
+
+    def test_concurrent_items_are_batched(self, batch_fn):
+        """Test that items arriving within the window share one batch call."""
+        batcher = MicroBatcher(batch_fn, max_batch_size=4, max_wait=1.0)
+        try:
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                results = list(pool.map(batcher.submit, range(4)))
+        finally:
+            batcher.close()
+
+        assert results == [0, 2, 4, 6]
+        batch_fn.assert_called_once()
+        assert sorted(batch_fn.call_args[0][0]) == [0, 1, 2, 3]
+
+    def test_per_item_exception(self):
+        """Test that an exception result is raised only to its own caller."""
+        batcher = MicroBatcher(
+            lambda items: [ValueError("bad") if item < 0 else item for item in items],
+            max_batch_size=2,
+            max_wait=1.0,
+        )
+        try:
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                ok = pool.submit(batcher.submit, 1)
+                bad = pool.submit(batcher.submit, -1)
+                assert ok.result() == 1
+                with pytest.raises(ValueError, match="bad"):
+                    bad.result()
+        finally:
+            batcher.close()
+
+    def test_batch_failure_propagates_to_all(self):
+        """Test that a failing batch call raises to every caller."""
+        batcher = MicroBatcher(Mock(side_effect=RuntimeError("LLM down")), max_wait=0.001)
+        try:
+            with pytest.raises(RuntimeError, match="LLM down"):
+                batcher.submit("question")
+        finally:
+            batcher.close()
+
+    def test_result_count_mismatch_fails_all(self):
+        """Test that too few results fail every caller instead of leaving some blocked."""
+        batcher = MicroBatcher(lambda items: items[:1], max_batch_size=2, max_wait=1.0)
+        try:
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                futures = [pool.submit(batcher.submit, i) for i in range(2)]
+                for future in futures:
+                    with pytest.raises(RuntimeError, match="1 result"):
+                        future.result(timeout=5)
+        finally:
+            batcher.close()
+
+    def test_close_stops_worker(self, batch_fn):
+        """Test that close joins the worker thread."""
+        batcher = MicroBatcher(batch_fn, max_wait=0.001)
+        batcher.submit(1)
+        worker = batcher._worker
+        batcher.close()
+        assert worker is not None and not worker.is_alive()
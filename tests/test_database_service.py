@@ -1,34 +1,35 @@
 import pytest
-import tempfile
+from decimal import Decimal
 from pathlib import Path
 from unittest.mock import patch
 
-from src.services.database_service import DuckDBService
+from src.services.database_service import DuckDBService, _apply_row_limit
 
 
 class TestDuckDBService:
-    @pytest.fixture
-    def temp_db_path(self):
-        """Create a temporary database path."""
-        import tempfile
-        import os
-        from pathlib import Path
+    @pytest.fixture(scope="class")
+    @classmethod
+    def temp_db_path(cls, tmp_path_factory):
+        """Create a temporary database path shared by the class's tests."""
+        # tmp_path_factory directories are unique per xdist worker, and DuckDB
+        # creates the file on first connect
+        return str(tmp_path_factory.mktemp("db") / "test.db")
 
-        # Create a temporary file and immediately delete it to get a unique path
-        fd, path = tempfile.mkstemp(suffix=".db")
-        os.close(fd)
-        os.unlink(path)  # Remove the file so DuckDB can create it
+    @pytest.fixture(scope="class")
+    @classmethod
+    def db_service(cls):
+        """Create an in-memory DuckDBService instance shared by the class's tests."""
+        # Only the tests exercising the file path need an on-disk database
+        service = DuckDBService(":memory:", max_rows=100)
+        yield service
+        service.close()
 
-        yield path
-
-        # Clean up
-        if os.path.exists(path):
-            os.unlink(path)
-
-    @pytest.fixture
-    def db_service(self, temp_db_path):
-        """Create a DuckDBService instance."""
-        return DuckDBService(temp_db_path, max_rows=100)
+    @pytest.fixture(autouse=True)
+    def _drop_tables(self, db_service):
+        """Drop tables created by a test so the next one starts from an empty database."""
+        yield
+        for table in db_service.execute_query("SHOW TABLES"):
+            db_service.execute_query(f"DROP TABLE {table['name']}")
 
     def test_init(self, temp_db_path):
         """Test service initialization."""
@@ -37,6 +38,19 @@ class TestDuckDBService:
         assert service.connection is None
         assert service.max_rows == 10000  # default
 
+    def test_data_persists_across_connections(self, temp_db_path):
+        """Test that an on-disk database keeps its data after the service closes."""
+        service = DuckDBService(temp_db_path)
+        service.execute_query("CREATE TABLE persisted (id INTEGER)")
+        service.execute_query("INSERT INTO persisted VALUES (1)")
+        service.close()
+
+        reopened = DuckDBService(temp_db_path)
+        try:
+            assert reopened.execute_query("SELECT id FROM persisted") == [{"id": 1}]
+        finally:
+            reopened.close()
+
     def test_execute_query_select(self, db_service):
         """Test executing a SELECT query."""
         # Create a test table
@@ -50,17 +64,110 @@ class TestDuckDBService:
         assert results[1]["id"] == 2
         assert results[1]["name"] == "Bob"
 
+    def test_execute_query_decimals_as_floats(self, db_service):
+        """Test that DECIMAL columns and aggregates come back as floats."""
+        db_service.execute_query("CREATE TABLE test (price DECIMAL(4, 2))")
+        db_service.execute_query("INSERT INTO test VALUES (9.99), (0.01), (NULL)")
+
+        results = db_service.execute_query("SELECT price, SUM(price) OVER () AS total FROM test")
+        assert results[0] == {"price": 9.99, "total": 10.0}
+        assert all(isinstance(row["total"], float) for row in results)
+        assert results[2]["price"] is None
+
+    def test_execute_query_decimal_lists_untouched(self, db_service):
+        """Test that DECIMAL list columns are returned rather than failing conversion."""
+        results = db_service.execute_query("SELECT [1.5::DECIMAL(4, 2)] AS prices")
+        assert results == [{"prices": [Decimal("1.50")]}]
+
     def test_execute_query_with_limit(self, db_service):
         """Test query execution with automatic LIMIT."""
         # Create a test table with many rows
         db_service.execute_query("CREATE TABLE test (id INTEGER)")
-        values = ", ".join(f"({i})" for i in range(200))
-        db_service.execute_query(f"INSERT INTO test VALUES {values}")
+        assert db_service.bulk_insert("test", [{"id": i} for i in range(200)]) == 200
 
         # Query without explicit LIMIT should be limited to max_rows
         results = db_service.execute_query("SELECT * FROM test ORDER BY id")
         assert len(results) == 100  # max_rows
 
+        # An explicit LIMIT below max_rows is respected rather than replaced
+        results = db_service.execute_query("SELECT * FROM test ORDER BY id LIMIT 5")
+        assert [row["id"] for row in results] == [0, 1, 2, 3, 4]
+
+    def test_bulk_insert(self, db_service):
+        """Test bulk inserting records and DataFrames matched by column name."""
+        import pandas as pd
+
+        db_service.execute_query("CREATE TABLE test (id INTEGER, name VARCHAR)")
+        db_service.bulk_insert("test", [{"name": "Alice", "id": 1}])
+        db_service.bulk_insert("test", pd.DataFrame({"id": [2, 3], "name": ["Bob", "Carol"]}))
+
+        assert db_service.bulk_insert("test", []) == 0
+        results = db_service.execute_query("SELECT * FROM test ORDER BY id")
+        assert results == [
+            {"id": 1, "name": "Alice"},
+            {"id": 2, "name": "Bob"},
+            {"id": 3, "name": "Carol"},
+        ]
+
+        with pytest.raises(RuntimeError, match="Failed to bulk insert"):
+            db_service.bulk_insert("missing", [{"id": 1}])
+
+    def test_bulk_insert_arrow_and_quoted_names(self, db_service):
+        """Test inserting Arrow tables into schema-qualified tables needing quotes."""
+        import pyarrow as pa
+
+        db_service.execute_statement("CREATE SCHEMA IF NOT EXISTS staging")
+        db_service.execute_query('CREATE TABLE staging."order items" (id INTEGER)')
+        try:
+            assert db_service.bulk_insert("staging.order items", pa.table({"id": [1, 2]})) == 2
+            assert db_service.bulk_insert("staging.order items", [{"id": 3}]) == 1
+            assert db_service.execute_statement(
+                'SELECT id FROM staging."order items" ORDER BY id'
+            ) == [(1,), (2,), (3,)]
+        finally:
+            db_service.execute_statement("DROP SCHEMA staging CASCADE")
+
+    def test_execute_query_caps_rows_without_limit(self, db_service):
+        """Test that rows are capped even when no LIMIT is injected."""
+        results = db_service.execute_query("WITH t AS (SELECT * FROM range(200)) SELECT * FROM t")
+        assert len(results) == 100  # max_rows
+
+        results = db_service.execute_query("FROM range(200)", max_rows=5)
+        assert len(results) == 5
+
+    def test_execute_query_arrow(self, db_service):
+        """Test columnar results with the same row limits as execute_query."""
+        db_service.execute_query("CREATE TABLE test (id INTEGER, name VARCHAR)")
+        db_service.execute_query("INSERT INTO test VALUES (1, 'Alice'), (2, 'Bob')")
+
+        table = db_service.execute_query_arrow("SELECT * FROM test ORDER BY id")
+        assert table.column_names == ["id", "name"]
+        assert table.to_pylist() == db_service.execute_query("SELECT * FROM test ORDER BY id")
+
+        assert db_service.execute_query_arrow("SELECT * FROM range(200)").num_rows == 100
+        assert db_service.execute_query_arrow("FROM range(200)", max_rows=5).num_rows == 5
+
+        with pytest.raises(RuntimeError, match="Failed to execute query"):
+            db_service.execute_query_arrow("INVALID SQL QUERY")
+
+    def test_apply_row_limit(self):
+        """Test LIMIT injection decisions made on the parsed query."""
+        # "LIMIT" inside literals, comments or subqueries is not a top-level LIMIT
+        assert _apply_row_limit("SELECT 'LIMIT' AS word FROM t", 10).endswith("LIMIT 10")
+        assert _apply_row_limit(
+            "SELECT * FROM (SELECT * FROM t LIMIT 5) AS s", 10
+        ).endswith("LIMIT 10")
+        assert _apply_row_limit("SELECT 1 UNION SELECT 2", 10).endswith("LIMIT 10")
+
+        # An existing top-level LIMIT is kept as-is, never doubled
+        assert _apply_row_limit("SELECT * FROM t LIMIT 5", 10) == "SELECT * FROM t LIMIT 5"
+        assert _apply_row_limit("SELECT * FROM t -- limit\nLIMIT 5", 10).count("LIMIT") == 1
+
+        # Statements that are not queries or cannot be parsed are left untouched
+        assert _apply_row_limit("SHOW TABLES", 10) == "SHOW TABLES"
+        assert _apply_row_limit("CREATE TABLE t (id INTEGER)", 10) == "CREATE TABLE t (id INTEGER)"
+        assert _apply_row_limit("INVALID SQL QUERY (", 10) == "INVALID SQL QUERY ("
+
     def test_execute_query_invalid_sql(self, db_service):
         """Test handling of invalid SQL."""
         with pytest.raises(RuntimeError, match="Failed to execute query"):
@@ -85,6 +192,59 @@ class TestDuckDBService:
         schema = db_service.get_table_info()
         assert schema == "No tables found in database."
 
+    def test_get_table_info_error(self, db_service):
+        """Test that catalog failures raise instead of returning an error string."""
+        db_service.invalidate_schema_cache()
+        with patch.object(db_service, "_get_connection", side_effect=Exception("transient lock")):
+            with pytest.raises(RuntimeError, match="Failed to retrieve schema"):
+                db_service.get_table_info()
+
+    def test_schema_cached_until_ddl(self, db_service):
+        """Test that schema lookups skip the catalog until DDL runs."""
+        db_service.execute_query("CREATE TABLE users (id INTEGER)")
+        schema = db_service.get_table_info()
+        fingerprint = db_service.schema_fingerprint()
+
+        with patch.object(db_service, "_get_connection", side_effect=AssertionError("catalog queried")):
+            assert db_service.get_table_info() == schema
+            assert db_service.schema_fingerprint() == fingerprint
+
+        db_service.execute_query("INSERT INTO users VALUES (1)")
+        assert db_service.get_table_info() == schema
+
+        db_service.execute_query("CREATE TABLE orders (id INTEGER)")
+        assert "Table: orders" in db_service.get_table_info()
+        assert db_service.schema_fingerprint() != fingerprint
+
+        db_service.invalidate_schema_cache()
+        with patch.object(db_service, "_get_connection", side_effect=AssertionError("catalog queried")):
+            with pytest.raises(RuntimeError):
+                db_service.schema_fingerprint()
+
+    def test_schema_fingerprint(self, db_service):
+        """Test that the fingerprint changes only when the schema changes."""
+        empty = db_service.schema_fingerprint()
+
+        db_service.execute_query("CREATE TABLE users (id INTEGER)")
+        created = db_service.schema_fingerprint()
+        assert created != empty
+
+        db_service.execute_query("INSERT INTO users VALUES (1)")
+        assert db_service.schema_fingerprint() == created
+
+        db_service.execute_query("ALTER TABLE users ADD COLUMN name VARCHAR")
+        assert db_service.schema_fingerprint() != created
+
+    def test_execute_statement(self, db_service):
+        """Test parameterized statements return raw rows without a row cap."""
+        db_service.execute_statement("CREATE TABLE kv (k VARCHAR, v INTEGER)")
+        db_service.execute_statement("INSERT INTO kv VALUES (?, ?)", ["a", 1])
+
+        assert db_service.execute_statement("SELECT k, v FROM kv WHERE k = ?", ["a"]) == [("a", 1)]
+
+        with pytest.raises(RuntimeError, match="Failed to execute statement"):
+            db_service.execute_statement("SELECT * FROM missing")
+
     def test_get_table_count(self, db_service):
         """Test getting table count."""
         assert db_service.get_table_count() == 0
@@ -95,14 +255,16 @@ class TestDuckDBService:
         db_service.execute_query("CREATE TABLE test2 (id INTEGER)")
         assert db_service.get_table_count() == 2
 
-    def test_close(self, db_service):
+    def test_close(self):
         """Test closing database connection."""
+        # A service of its own, so the shared one keeps its connection and data
+        service = DuckDBService(":memory:")
         # Execute a query to establish connection
-        db_service.execute_query("SELECT 1")
-        assert db_service.connection is not None
+        service.execute_query("SELECT 1")
+        assert service.connection is not None
 
-        db_service.close()
-        assert db_service.connection is None
+        service.close()
+        assert service.connection is None
 
     def test_context_manager(self, db_service):
         """Test that connection is properly managed."""
@@ -110,11 +272,39 @@ class TestDuckDBService:
             result = conn.execute("SELECT 1 as test").fetchone()
             assert result[0] == 1
 
+        # The underlying connection stays open and is reused across calls
+        connection = db_service.connection
+        assert connection is not None
+        with db_service._get_connection() as conn:
+            conn.execute("SELECT 1")
+        assert db_service.connection is connection
+
+    def test_concurrent_queries_share_connection(self, db_service):
+        """Test that queries from several threads use cursors on one connection."""
+        from concurrent.futures import ThreadPoolExecutor
+
+        db_service.execute_query("CREATE TABLE test (id INTEGER)")
+        db_service.bulk_insert("test", [{"id": i} for i in range(50)])
+        connection = db_service.connection
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            counts = list(
+                executor.map(
+                    lambda _: db_service.execute_query("SELECT COUNT(*) AS n FROM test")[0]["n"],
+                    range(32),
+                )
+            )
+
+        assert counts == [50] * 32
+        assert db_service.connection is connection
+
     @patch("src.services.database_service.connect")
-    def test_connection_error_handling(self, mock_connect, db_service):
+    def test_connection_error_handling(self, mock_connect, temp_db_path):
         """Test handling of connection errors."""
         mock_connect.side_effect = Exception("Connection failed")
+        # A fresh service, since the shared one may already hold a connection
+        service = DuckDBService(temp_db_path)
 
         with pytest.raises(RuntimeError, match="Failed to initialize DuckDB connection"):
-            with db_service._get_connection():
+            with service._get_connection():
                 pass
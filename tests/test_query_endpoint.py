@@ -1,37 +1,28 @@
+import asyncio
+import time
+import uuid
+
+import httpx
 import pytest
-from unittest.mock import Mock, patch
-from fastapi.testclient import TestClient
 from fastapi import HTTPException
 
-from src.main import app
+from src.api.dependencies import get_services
+from src.core.rate_limit import limiter
+from src.main import app, health_check, root
 from src.services.database_service import DuckDBService
-from src.chains.sql_chain import SQLChainManager
-
-
-@pytest.fixture
-def client():
-    """Test client for FastAPI app."""
-    # Provide a unique header so the shared limiter won't collide across tests
-    import uuid
-
-    test_id = str(uuid.uuid4())
-    return TestClient(app, headers={"x-test-id": test_id})
-
-
-@pytest.fixture
-def mock_services():
-    """Mock services for testing."""
-    mock_db = Mock(spec=DuckDBService)
-    mock_chain = Mock(spec=SQLChainManager)
-
-    mock_db.execute_query.return_value = [
-        {"id": 1, "name": "Alice", "email": "alice@example.com"},
-        {"id": 2, "name": "Bob", "email": "bob@example.com"},
-    ]
 
-    mock_chain.natural_language_to_sql.return_value = "SELECT * FROM users;"
 
-    return mock_db, mock_chain
+def _preload_rate_limit(client, path, view_func):
+    """Spend all but one of the client's allowed hits on a route."""
+    # Same (key, path) identifiers SlowAPI hits for the request, so only the
+    # last allowed request and the first rejected one go through the app
+    (route_limit,) = limiter._route_limits[f"{view_func.__module__}.{view_func.__name__}"]
+    limiter.limiter.hit(
+        route_limit.limit,
+        client.headers["x-test-id"],
+        path,
+        cost=route_limit.limit.amount - 1,
+    )
 
 
 class TestQueryEndpoint:
@@ -51,16 +42,14 @@ class TestQueryEndpoint:
         data = response.json()
         assert data["status"] == "healthy"
 
-    @patch("src.main.services", new_callable=lambda: (Mock(), Mock()))
-    def test_query_endpoint_nlq_success(self, mock_services, client):
+    def test_query_endpoint_nlq_success(self, patched_services, client):
         """Test successful NLQ query execution."""
-        mock_db, mock_chain = mock_services
+        stub_db, stub_chain = patched_services
 
-        with patch("src.api.endpoint.query.get_services", return_value=mock_services):
-            response = client.post(
-                "/api/query",
-                json={"question": "Show me all users", "use_nlq": True}
-            )
+        response = client.post(
+            "/api/query",
+            json={"question": "Show me all users", "use_nlq": True}
+        )
 
         assert response.status_code == 200
         data = response.json()
@@ -69,95 +58,163 @@ class TestQueryEndpoint:
         assert data["query"] == "SELECT * FROM users;"
         assert len(data["results"]) == 2
 
-        mock_chain.natural_language_to_sql.assert_called_once_with("Show me all users")
-        mock_db.execute_query.assert_called_once_with("SELECT * FROM users;")
+        assert stub_chain.calls == [("Show me all users",)]
+        assert stub_db.calls == [("SELECT * FROM users;", 1000)]
 
-    @patch("src.main.services", new_callable=lambda: (Mock(), Mock()))
-    def test_query_endpoint_direct_sql_success(self, mock_services, client):
+    def test_query_endpoint_direct_sql_success(self, patched_services, client):
         """Test successful direct SQL query execution."""
-        mock_db, mock_chain = mock_services
+        stub_db, stub_chain = patched_services
 
-        with patch("src.api.endpoint.query.get_services", return_value=mock_services):
-            response = client.post(
-                "/api/query",
-                json={"question": "SELECT * FROM users;", "use_nlq": False}
-            )
+        response = client.post(
+            "/api/query",
+            json={"question": "SELECT * FROM users;", "use_nlq": False}
+        )
 
         assert response.status_code == 200
         data = response.json()
         assert data["query"] == "SELECT * FROM users;"
         assert len(data["results"]) == 2
 
-        mock_chain.natural_language_to_sql.assert_not_called()
-        mock_db.execute_query.assert_called_once_with("SELECT * FROM users;")
+        assert stub_chain.calls == []
+        assert stub_db.calls == [("SELECT * FROM users;", 1000)]
+
+    def test_query_endpoint_max_rows_passed_to_db(self, patched_services, client):
+        """Test that the requested row cap is enforced by the database layer."""
+        stub_db, stub_chain = patched_services
+
+        response = client.post(
+            "/api/query",
+            json={"question": "SELECT * FROM users;", "use_nlq": False, "max_rows": 1}
+        )
+
+        assert response.status_code == 200
+        assert stub_db.calls == [("SELECT * FROM users;", 1)]
+
+    def test_query_endpoint_runs_blocking_calls_off_event_loop(self, patched_services):
+        """Test that slow database calls from concurrent requests overlap."""
+        stub_db, stub_chain = patched_services
+        delay = 0.3
+        stub_db.set(results=[], delay=delay)
+
+        async def send_concurrently(count):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(
+                transport=transport,
+                base_url="http://testserver",
+                headers={"x-test-id": str(uuid.uuid4())},
+            ) as async_client:
+                return await asyncio.gather(
+                    *(
+                        async_client.post(
+                            "/api/query",
+                            json={"question": "SELECT 1;", "use_nlq": False},
+                        )
+                        for _ in range(count)
+                    )
+                )
+
+        start = time.perf_counter()
+        responses = asyncio.run(send_concurrently(3))
+        elapsed = time.perf_counter() - start
+
+        assert [response.status_code for response in responses] == [200, 200, 200]
+        # Serial execution would take at least 3 * delay
+        assert elapsed < 3 * delay
+
+    def test_query_endpoint_serializes_duckdb_types(self, mock_services, client, monkeypatch):
+        """Test that DuckDB column types come back as JSON numbers and strings."""
+        _, stub_chain = mock_services
+        db_service = DuckDBService(":memory:")
+        monkeypatch.setitem(
+            app.dependency_overrides, get_services, lambda: (db_service, stub_chain)
+        )
+        sql = (
+            "SELECT '12345678-1234-5678-1234-567812345678'::UUID AS id, "
+            "9.99::DECIMAL(4, 2) AS price, SUM(x) AS total, "
+            "TIMESTAMP '2024-01-02 03:04:05' AS created_at, DATE '2024-01-02' AS day "
+            "FROM (VALUES (1.5), (2.5)) AS t(x)"
+        )
+
+        try:
+            response = client.post("/api/query", json={"question": sql, "use_nlq": False})
+        finally:
+            db_service.close()
+
+        assert response.status_code == 200
+        assert response.json()["results"] == [
+            {
+                "id": "12345678-1234-5678-1234-567812345678",
+                "price": 9.99,
+                "total": 4.0,
+                "created_at": "2024-01-02T03:04:05",
+                "day": "2024-01-02",
+            }
+        ]
 
-    @patch("src.main.services", new_callable=lambda: (Mock(), Mock()))
-    def test_query_endpoint_invalid_direct_sql(self, mock_services, client):
+    def test_query_endpoint_invalid_direct_sql(self, patched_services, client):
         """Test rejection of invalid direct SQL."""
-        mock_db, mock_chain = mock_services
+        stub_db, stub_chain = patched_services
 
-        with patch("src.api.endpoint.query.get_services", return_value=mock_services):
-            response = client.post(
-                "/api/query",
-                json={"question": "DROP TABLE users;", "use_nlq": False}
-            )
+        response = client.post(
+            "/api/query",
+            json={"question": "DROP TABLE users;", "use_nlq": False}
+        )
 
         assert response.status_code == 400
         data = response.json()
         assert "Invalid SQL query" in data["detail"]
 
-        mock_db.execute_query.assert_not_called()
+        assert stub_db.calls == []
 
     def test_query_endpoint_empty_question(self, client):
         """Test validation of empty question."""
         response = client.post("/api/query", json={"question": "", "use_nlq": True})
         assert response.status_code == 422  # Validation error
 
+    def test_query_endpoint_question_too_long(self, client):
+        """Test that the Field length bound rejects oversized questions."""
+        response = client.post("/api/query", json={"question": "a" * 1001, "use_nlq": True})
+        assert response.status_code == 422  # Validation error
+
     def test_query_endpoint_whitespace_question(self, client):
         """Test validation of whitespace-only question."""
         response = client.post("/api/query", json={"question": "   ", "use_nlq": True})
         assert response.status_code == 422  # Validation error
 
-    @patch("src.main.services", None)
     def test_query_endpoint_services_not_initialized(self, client):
         """Test handling when services are not initialized."""
-        with patch("src.api.endpoint.query.get_services", side_effect=RuntimeError("Services not initialized")):
-            response = client.post(
-                "/api/query",
-                json={"question": "SELECT 1;", "use_nlq": False}
-            )
+        response = client.post(
+            "/api/query",
+            json={"question": "SELECT 1;", "use_nlq": False}
+        )
 
         assert response.status_code == 500
         data = response.json()
         assert "Services not initialized" in data["detail"]
 
-    @patch("src.main.services", new_callable=lambda: (Mock(), Mock()))
-    def test_query_endpoint_execution_error(self, mock_services, client):
+    def test_query_endpoint_execution_error(self, patched_services, client):
         """Test handling of query execution errors."""
-        mock_db, mock_chain = mock_services
-        mock_db.execute_query.side_effect = Exception("Database error")
+        stub_db, stub_chain = patched_services
+        stub_db.set(error=Exception("Database error"))
 
-        with patch("src.api.endpoint.query.get_services", return_value=mock_services):
-            response = client.post(
-                "/api/query",
-                json={"question": "SELECT * FROM users;", "use_nlq": False}
-            )
+        response = client.post(
+            "/api/query",
+            json={"question": "SELECT * FROM users;", "use_nlq": False}
+        )
 
         assert response.status_code == 500
         data = response.json()
         assert "Query execution failed" in data["detail"]
 
-    @patch("src.main.services", new_callable=lambda: (Mock(), Mock()))
-    def test_query_endpoint_nlq_error(self, mock_services, client):
+    def test_query_endpoint_nlq_error(self, patched_services, client):
         """Test handling of NLQ conversion errors."""
-        mock_db, mock_chain = mock_services
-        mock_chain.natural_language_to_sql.side_effect = Exception("LLM error")
+        stub_db, stub_chain = patched_services
+        stub_chain.set(error=Exception("LLM error"))
 
-        with patch("src.api.endpoint.query.get_services", return_value=mock_services):
-            response = client.post(
-                "/api/query",
-                json={"question": "Show users", "use_nlq": True}
-            )
+        response = client.post(
+            "/api/query",
+            json={"question": "Show users", "use_nlq": True}
+        )
 
         assert response.status_code == 500
         data = response.json()
@@ -165,46 +222,48 @@ class TestQueryEndpoint:
 
     def test_rate_limiting_root(self, client):
         """Test rate limiting on root endpoint."""
-        # Make multiple requests quickly
-        response = None
-        for i in range(15):  # Exceed the 10/minute limit
-            response = client.get("/")
+        _preload_rate_limit(client, "/", root)
 
-        # Last request should be rate limited
-        assert response is not None
-        assert response.status_code == 429
+        assert client.get("/").status_code == 200
+        assert client.get("/").status_code == 429
 
     def test_rate_limiting_health(self, client):
         """Test rate limiting on health endpoint."""
+        _preload_rate_limit(client, "/health", health_check)
+
+        assert client.get("/health").status_code == 200
+        assert client.get("/health").status_code == 429
+
+    @pytest.mark.slow
+    def test_rate_limiting_root_end_to_end(self, client):
+        """Test rate limiting on root endpoint through real requests only."""
         # Make multiple requests quickly
         response = None
-        for i in range(35):  # Exceed the 30/minute limit
-            response = client.get("/health")
+        for i in range(15):  # Exceed the 10/minute limit
+            response = client.get("/")
 
         # Last request should be rate limited
         assert response is not None
         assert response.status_code == 429
 
-    @patch("src.main.services", new_callable=lambda: (Mock(), Mock()))
-    def test_query_endpoint_show_all_tables_nlq(self, mock_services, client):
+    def test_query_endpoint_show_all_tables_nlq(self, patched_services, client):
         """Test successful NLQ query for showing all tables."""
-        mock_db, mock_chain = mock_services
+        stub_db, stub_chain = patched_services
 
-        # Mock the NLQ conversion to return SHOW TABLES
-        mock_chain.natural_language_to_sql.return_value = "SHOW TABLES;"
+        # Stub the NLQ conversion to return SHOW TABLES
+        stub_chain.set(sql="SHOW TABLES;")
 
-        # Mock the database execution to return table list
-        mock_db.execute_query.return_value = [
+        # Stub the database execution to return table list
+        stub_db.set(results=[
             {"name": "users"},
             {"name": "products"},
             {"name": "orders"}
-        ]
+        ])
 
-        with patch("src.api.endpoint.query.get_services", return_value=mock_services):
-            response = client.post(
-                "/api/query",
-                json={"question": "tampilkan semua table", "use_nlq": True}
-            )
+        response = client.post(
+            "/api/query",
+            json={"question": "tampilkan semua table", "use_nlq": True}
+        )
 
         assert response.status_code == 200
         data = response.json()
@@ -216,5 +275,5 @@ class TestQueryEndpoint:
         assert data["results"][1]["name"] == "products"
         assert data["results"][2]["name"] == "orders"
 
-        mock_chain.natural_language_to_sql.assert_called_once_with("tampilkan semua table")
-        mock_db.execute_query.assert_called_once_with("SHOW TABLES;")
+        assert stub_chain.calls == [("tampilkan semua table",)]
+        assert stub_db.calls == [("SHOW TABLES;", 1000)]
@@ -0,0 +1,186 @@
+import numpy as np
+import pytest
+from unittest.mock import Mock
+
+from src.chains.sql_cache import DuckDBSQLCacheStore, SQLCache, normalize_question
+from src.services.database_service import DuckDBService
+
+
+class TestSQLCache:
+    @pytest.fixture
+    def mock_embeddings(self):
+        """Mock embeddings mapping questions to fixed vectors."""
+        vectors = {
+            "Show me all users": [1.0, 0.0, 0.0],
+            "List every user": [0.98, 0.2, 0.0],
+            "How many orders are there?": [0.0, 1.0, 0.0],
+        }
+        embeddings = Mock()
+        embeddings.embed_query.side_effect = lambda q: vectors.get(q, [0.0, 0.0, 1.0])
+        return embeddings
+
+    def test_normalize_question(self):
+        """Test question normalization for exact lookups."""
+        assert normalize_question("  Show   ME all\tusers ") == "show me all users"
+
+    def test_exact_hit_without_embeddings(self):
+        """Test exact-match caching when no embedding model is configured."""
+        cache = SQLCache()
+        cache.store("Show me all users", "SELECT * FROM users;")
+
+        sql, vector = cache.lookup("show me  all users")
+        assert sql == "SELECT * FROM users;"
+        assert vector is None
+
+        assert cache.lookup("List every user") == (None, None)
+
+    def test_semantic_hit(self, mock_embeddings):
+        """Test that paraphrased questions reuse cached SQL."""
+        cache = SQLCache(mock_embeddings)
+        _, vector = cache.lookup("Show me all users")
+        cache.store("Show me all users", "SELECT * FROM users;", vector)
+
+        sql, _ = cache.lookup("List every user")
+        assert sql == "SELECT * FROM users;"
+
+        sql, _ = cache.lookup("How many orders are there?")
+        assert sql is None
+
+    def test_lru_eviction(self, mock_embeddings):
+        """Test that the least recently used entry is evicted when full."""
+        cache = SQLCache(mock_embeddings, max_entries=2)
+        for question in ("Show me all users", "How many orders are there?"):
+            _, vector = cache.lookup(question)
+            cache.store(question, f"SQL for {question}", vector)
+
+        # Touch the first entry so the second becomes least recently used
+        assert cache.lookup("Show me all users")[0] is not None
+        cache.store("Something else", "SELECT 1;", cache.embed("Something else"))
+
+        assert len(cache) == 2
+        assert cache.lookup("How many orders are there?")[0] is None
+        assert cache.lookup("List every user")[0] == "SQL for Show me all users"
+
+    def test_embedding_failure_falls_back_to_exact(self):
+        """Test that embedding errors degrade to exact-match caching."""
+        embeddings = Mock()
+        embeddings.embed_query.side_effect = Exception("model unavailable")
+        cache = SQLCache(embeddings)
+
+        assert cache.lookup("Show me all users") == (None, None)
+        cache.store("Show me all users", "SELECT * FROM users;")
+        assert cache.lookup("Show me all users")[0] == "SELECT * FROM users;"
+
+    def test_lookup_with_other_dimension_misses(self, mock_embeddings):
+        """Test that a query vector of another dimension misses instead of raising."""
+        cache = SQLCache(mock_embeddings)
+        cache.store("Show me all users", "SELECT * FROM users;", np.array([1.0, 0.0], dtype=np.float32))
+        cache.store("Other", "SELECT 2;", np.array([1.0, 0.0, 0.0], dtype=np.float32))
+
+        assert cache.lookup("List every user")[0] is None
+        assert cache.lookup("other")[0] == "SELECT 2;"
+
+    def test_clear(self):
+        """Test clearing the cache."""
+        cache = SQLCache()
+        cache.store("Show me all users", "SELECT * FROM users;")
+        cache.clear()
+        assert len(cache) == 0
+        assert cache.lookup("Show me all users")[0] is None
+
+
+class TestDuckDBSQLCacheStore:
+    @pytest.fixture
+    def db_service(self):
+        """In-memory DuckDB service backing the persisted cache."""
+        service = DuckDBService(":memory:")
+        yield service
+        service.close()
+
+    def test_entries_survive_restart(self, db_service):
+        """Test that a new cache restores entries persisted for the same schema."""
+        cache = SQLCache(store=DuckDBSQLCacheStore(db_service))
+        cache.load("fp1")
+        cache.store("Show me all users", "SELECT * FROM users;", np.array([1.0, 0.0], dtype=np.float32))
+        cache.close()
+
+        restored = SQLCache(store=DuckDBSQLCacheStore(db_service))
+        restored.load("fp1")
+        assert len(restored) == 1
+        assert restored.lookup("show me all users")[0] == "SELECT * FROM users;"
+        restored.close()
+
+    def test_entries_dropped_on_schema_change(self, db_service):
+        """Test that entries persisted for another schema are not restored."""
+        cache = SQLCache(store=DuckDBSQLCacheStore(db_service))
+        cache.load("fp1")
+        cache.store("Show me all users", "SELECT * FROM users;")
+
+        cache.load("fp2")
+        assert len(cache) == 0
+        assert db_service.execute_statement(f"SELECT count(*) FROM {DuckDBSQLCacheStore.TABLE}") == [(0,)]
+        cache.close()
+
+    def test_embeddings_dropped_on_model_change(self, db_service):
+        """Test that vectors from another embedding model are not restored."""
+        old_model = Mock(model_name="old-model")
+        old_model.embed_query.return_value = [1.0, 0.0]
+        cache = SQLCache(old_model, store=DuckDBSQLCacheStore(db_service))
+        cache.load("fp1")
+        _, vector = cache.lookup("Show me all users")
+        cache.store("Show me all users", "SELECT * FROM users;", vector)
+        cache.close()
+
+        new_model = Mock(model_name="new-model")
+        new_model.embed_query.return_value = [1.0, 0.0, 0.0]
+        restored = SQLCache(new_model, store=DuckDBSQLCacheStore(db_service))
+        restored.load("fp1")
+        assert restored.lookup("List every user")[0] is None
+        assert restored.lookup("show me all users")[0] == "SELECT * FROM users;"
+        restored.close()
+
+        assert db_service.execute_statement(
+            f"SELECT embedding, embedding_model, embedding_dim FROM {DuckDBSQLCacheStore.TABLE}"
+        ) == [(None, None, None)]
+
+    def test_mixed_dimensions_restore_latest(self, db_service):
+        """Test that only vectors of the most recently saved dimension are restored."""
+        store = DuckDBSQLCacheStore(db_service)
+        store.save("question 2d", "SELECT 2;", np.array([1.0, 0.0], dtype=np.float32), "fp1", "Mock")
+        store.save("question 3d", "SELECT 3;", np.array([0.0, 1.0, 0.0], dtype=np.float32), "fp1", "Mock")
+
+        embeddings = Mock(spec=["embed_query"])
+        embeddings.embed_query.return_value = [0.0, 1.0, 0.0]
+        cache = SQLCache(embeddings, store=store)
+        cache.load("fp1")
+        assert len(cache) == 2
+        assert cache.lookup("something similar")[0] == "SELECT 3;"
+        # The older-dimension entry is kept for exact matches
+        assert cache.lookup("question 2d")[0] == "SELECT 2;"
+        cache.close()
+
+    def test_persisted_table_trimmed_to_max_entries(self, db_service):
+        """Test LRU trimming of the persisted table."""
+        store = DuckDBSQLCacheStore(db_service, max_entries=2)
+        for i in range(3):
+            store.save(f"question {i}", f"SELECT {i};", None, "fp1")
+
+        rows = store.load("fp1")
+        assert len(rows) == 2
+        assert "question 0" not in [key for key, _, _ in rows]
+
+    def test_hits_recorded(self, db_service):
+        """Test that cache hits update the persisted entry."""
+        cache = SQLCache(store=DuckDBSQLCacheStore(db_service))
+        cache.load("fp1")
+        cache.store("Show me all users", "SELECT * FROM users;")
+        cache.lookup("Show me all users")
+        cache.close()
+
+        assert db_service.execute_statement(f"SELECT hits FROM {DuckDBSQLCacheStore.TABLE}") == [(1,)]
+
+    def test_table_hidden_from_schema(self, db_service):
+        """Test that the cache table is not described to the LLM."""
+        DuckDBSQLCacheStore(db_service)
+        assert db_service.get_table_info() == "No tables found in database."
+        assert db_service.get_table_count() == 0